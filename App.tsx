@@ -458,19 +458,6 @@ const App: React.FC = () => {
             setThreads(prev => [{ id: sessionId, title: content || (files.length > 0 ? `Files: ${files[0].name}...` : "New Research"), radarId: selectedRadar?.id }, ...prev]);
         }
 
-        // Convert files
-        const uploadedFiles = await Promise.all(files.map(async (file) => {
-            return new Promise<{ name: string, mime_type: string, data: string }>((resolve, reject) => {
-                const reader = new FileReader();
-                reader.onload = () => {
-                    const base64 = (reader.result as string).split(',')[1];
-                    resolve({ name: file.name, mime_type: file.type, data: base64 });
-                };
-                reader.onerror = reject;
-                reader.readAsDataURL(file);
-            });
-        }));
-
         const userMessage: Message = {
             id: uuidv4(),
             role: 'user',
@@ -498,38 +485,88 @@ const App: React.FC = () => {
 
         try {
             const token = await user!.getIdToken();
-            const response = await fetch('/api/research', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
-                body: JSON.stringify({
-                    query: content,
-                    sessionId: sessionId,
-                    files: uploadedFiles,
-                    radarId: currentView === 'radar-chat' ? selectedRadar?.id : null,
-                    activeDocumentUrl: (!isRadarChat && activeDocument) ? activeDocument.url : null,
-                    agent_type: currentView === 'radar-chat' ? 'radar' : (currentView === 'projects' ? 'projects' : 'exploration')
-                }),
-            });
+            const payload: Record<string, string | null | undefined> = {
+                query: content,
+                sessionId: sessionId,
+                radarId: currentView === 'radar-chat' ? selectedRadar?.id : null,
+                activeDocumentUrl: (!isRadarChat && activeDocument) ? activeDocument.url : null,
+                agent_type: currentView === 'radar-chat' ? 'radar' : (currentView === 'projects' ? 'projects' : 'exploration')
+            };
+
+            let response: Response;
+            if (files.length > 0) {
+                // Send files as raw multipart bytes instead of base64 inside JSON
+                const form = new FormData();
+                Object.entries(payload).forEach(([key, value]) => {
+                    if (value != null) form.append(key, value);
+                });
+                files.forEach(file => form.append('files', file));
+                response = await fetch('/api/research/upload', {
+                    method: 'POST',
+                    headers: { 'Authorization': `Bearer ${token}` },
+                    body: form,
+                });
+            } else {
+                response = await fetch('/api/research', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
+                    body: JSON.stringify(payload),
+                });
+            }
 
             if (!response.ok) {
                 const errorData = await response.json().catch(() => ({ detail: 'Unknown backend error' }));
                 throw new Error(errorData.detail || `Agent error: ${response.statusText}`);
             }
 
-            const data = await response.json();
-            const assistantMessage: Message = {
-                id: uuidv4(),
-                role: 'assistant',
-                content: data.content || "Research synthesis complete.",
-                timestamp: new Date(),
-                files: data.files?.map((f: any) => ({
-                    path: f.path,
-                    type: f.type as any,
-                    name: f.name
-                })) || [],
+            // The backend streams NDJSON updates: "text" and "file" while the agent runs, then "done"
+            const assistantId = uuidv4();
+            let assistantShown = false;
+            let streamedFiles: Message['files'] = [];
+            const upsertAssistant = (patch: Partial<Message>) => {
+                const exists = assistantShown;
+                assistantShown = true;
+                setMessages(prev => exists
+                    ? prev.map(m => m.id === assistantId ? { ...m, ...patch } : m)
+                    : [...prev, { id: assistantId, role: 'assistant', content: '', timestamp: new Date(), files: [], ...patch }]);
             };
 
-            setMessages(prev => [...prev, assistantMessage]);
+            const reader = response.body!.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let finished = false;
+            while (!finished) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop() ?? '';
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const update = JSON.parse(line);
+                    if (update.event === 'text') {
+                        upsertAssistant({ content: update.text });
+                    } else if (update.event === 'file') {
+                        streamedFiles = [...(streamedFiles || []), { path: update.path, type: update.type as any, name: update.name }];
+                        upsertAssistant({ files: streamedFiles });
+                    } else if (update.event === 'done') {
+                        upsertAssistant({
+                            content: update.content || "Research synthesis complete.",
+                            files: update.files?.map((f: any) => ({
+                                path: f.path,
+                                type: f.type as any,
+                                name: f.name
+                            })) || [],
+                        });
+                        finished = true;
+                    } else if (update.event === 'error') {
+                        throw new Error(update.detail || 'Agent error');
+                    }
+                }
+            }
+            if (!finished) {
+                throw new Error('The research stream ended unexpectedly.');
+            }
         } catch (error) {
             console.error('Failed to contact agent service', error);
             const errorMessage: Message = {
@@ -1,23 +1,27 @@
+import asyncio
 import logging
 import uuid
-import base64
 import os
 import json
+import re
 import datetime
-from typing import Dict, Any, List, Optional
-from fastapi import APIRouter, HTTPException, Depends   
+from typing import Dict, Any, List, Optional, Union
+import orjson
+import pybase64
+from fastapi import APIRouter, HTTPException, Depends, File, Form, UploadFile
+from fastapi.responses import StreamingResponse
 from google.adk.runners import Runner
 from google.genai import types
 from google.adk.apps.app import App
-from app.core.schemas import ResearchRequest, ResearchResponse, FileItem
+from app.core.schemas import ResearchRequest, FileUpload
 from app.core.auth import get_current_user
 from app.core.session_storage import session_service
 from app.services import current_user_id
 from app.services.title_generator import generate_smart_title
-from app.core.config import DOCS_DIR
+from app.core.config import DOCS_DIR, FILE_TYPES_BY_EXT, MAX_UPLOAD_BYTES
 from app.core.user_data_service import user_data_service
+from app.api.threads import invalidate_threads_cache
 from app.agent import (
-    app as adk_app, 
     root_agent,
     research_radar_agent,
     exploration_agent,
@@ -28,24 +32,48 @@ from app.agent import (
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Characters outside word chars, '.' and '-' are replaced in stored upload names
+_UNSAFE_FILENAME_RE = re.compile(r"[^\w.-]")
+
+# Generated media paths as returned by the multimodal tools (e.g. static/audio/<name>.mp3)
+_STATIC_FILE_RE = re.compile(r"static/(audio|videos|slides)/[\w-]+\.(mp3|mp4|pptx|png)")
+_STATIC_FOLDER_TYPES = {"audio": "audio", "videos": "video", "slides": "presentation"}
+# Texts shorter than the shortest possible match are not scanned
+_MIN_STATIC_PATH_LEN = len("static/audio/x.mp3")
+
+# Uploads are stored flat under DOCS_DIR and served from /static/docs/
+_DOCS_PREFIX = DOCS_DIR + os.sep
+_DOCS_URL_PREFIX = "/static/docs/"
+_docs_dir_ready = False
+
+# Agent runs in flight; tasks are referenced here so they aren't garbage-collected mid-run
+_agent_runs: set = set()
+
+# Runners are stateless per request (session state lives in session_service), so one per App is reused
+_runners: Dict[str, Runner] = {}
+
+def _get_runner(target_app: App) -> Runner:
+    """Returns the shared Runner for the given ADK app, creating it on first use."""
+    runner = _runners.get(target_app.name)
+    if runner is None:
+        runner = Runner(app=target_app, session_service=session_service)
+        _runners[target_app.name] = runner
+    return runner
+
 async def _get_or_create_session(user_id: str, session_id: str, app_name: str, query: str, radar_id: Optional[str] = None):
     """
     Handles session retrieval or creation, including title generation.
-    Returns the session object.
+    Returns the session object. State changes for reused sessions are left to the caller.
     """
     try:
         existing_session = await session_service.get_session(user_id=user_id, session_id=session_id, app_name=app_name)
         if existing_session:
             logger.info(f"Reusing existing session: {session_id}")
-            # If radar_id changed or was provided, update it
-            if radar_id:
-                try:
-                    await session_service.update_session(user_id=user_id, session_id=session_id, app_name=app_name, state_update={"radar_id": radar_id})
-                except Exception as e:
-                    logger.warning(f"Failed to update session radar_id: {e}")
             return existing_session
     except Exception as e:
-        logger.warning(f"Error checking session {session_id}: {e}")
+        # Creating the session again would overwrite its persisted history
+        logger.error(f"Error loading session {session_id}: {e}")
+        raise
 
     # Create new session
     logger.info(f"Initializing session: {session_id}")
@@ -60,8 +88,10 @@ async def _get_or_create_session(user_id: str, session_id: str, app_name: str, q
         logger.warning(f"Title generation failed (non-critical): {e}")
 
     try:
-        await session_service.create_session(user_id=user_id, session_id=session_id, app_name=app_name, state=state)
-        return await session_service.get_session(user_id=user_id, session_id=session_id, app_name=app_name)
+        # Title and radar_id are written with the initial state, no follow-up read needed
+        session = await session_service.create_session(user_id=user_id, session_id=session_id, app_name=app_name, state=state)
+        invalidate_threads_cache(user_id)
+        return session
     except Exception as e:
         logger.error(f"Critical error creating session {session_id}: {e}")
         raise
@@ -103,111 +133,254 @@ async def _build_context_prompt(user_id: str, query: str, radar_id: Optional[str
 
     return context_text
 
-async def _process_uploaded_files(files: List[Any], session_id: str) -> tuple[List[types.Part], List[Dict]]:
+def _write_file(path: str, data: bytes) -> None:
+    # Write straight to the fd, bypassing Python's buffered IO layer
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+async def _read_upload(f: Union[FileUpload, UploadFile]) -> tuple[str, str, bytes]:
+    """Returns (name, mime_type, raw bytes) for a JSON (base64) or multipart upload."""
+    if isinstance(f, UploadFile):
+        return f.filename or "upload", f.content_type or "application/octet-stream", await f.read()
+    # Decode off the event loop so large uploads don't stall other requests.
+    # pybase64 uses a SIMD decoder and reads the ASCII str without an intermediate bytes copy.
+    return f.name, f.mime_type, await asyncio.to_thread(pybase64.b64decode, f.data, validate=False)
+
+def _upload_size(f: Union[FileUpload, UploadFile]) -> int:
+    """Decoded size of an upload, known before reading or decoding it."""
+    if isinstance(f, UploadFile):
+        return f.size or 0
+    return len(f.data) * 3 // 4
+
+def _upload_name(f: Union[FileUpload, UploadFile]) -> Optional[str]:
+    return f.filename if isinstance(f, UploadFile) else f.name
+
+async def _persist_file(f: Union[FileUpload, UploadFile], session_id: str) -> tuple[types.Part, Dict]:
+    """Writes a single upload to disk, returning its Gemini Part and metadata."""
+    name, mime_type, file_bytes = await _read_upload(f)
+    safe_name = _UNSAFE_FILENAME_RE.sub("_", name)
+    filename = f"{session_id}_{safe_name}"
+    file_abs_path = _DOCS_PREFIX + filename
+    
+    # Create the docs directory on the first upload rather than at import
+    global _docs_dir_ready
+    if not _docs_dir_ready:
+        os.makedirs(DOCS_DIR, exist_ok=True)
+        _docs_dir_ready = True
+    await asyncio.to_thread(_write_file, file_abs_path, file_bytes)
+    
+    url_path = _DOCS_URL_PREFIX + filename
+    # Stored in final form (absolute URL path, resolved type) so history rendering needs no rewriting
+    meta = {
+        "name": name,
+        "path": url_path,
+        "type": "pdf" if FILE_TYPES_BY_EXT.get(os.path.splitext(name)[1].lower()) == "pdf" else "other"
+    }
+    logger.info(f"Persisted file: {name}")
+    return types.Part(inline_data=types.Blob(mime_type=mime_type, data=file_bytes)), meta
+
+async def _process_uploaded_files(files: List[Union[FileUpload, UploadFile]], session_id: str) -> tuple[List[types.Part], List[Dict]]:
     """
-    Persists uploaded files to disk and creates Gemini Part objects.
+    Persists uploaded files to disk concurrently and creates Gemini Part objects.
     Returns (list of Parts, list of metadata dicts).
     """
     parts = []
     metadata = []
     
-    for f in files:
-        try:
-            file_bytes = base64.b64decode(f.data)
-            safe_name = "".join([c if c.isalnum() or c in ".-_" else "_" for c in f.name])
-            filename = f"{session_id}_{safe_name}"
-            file_abs_path = os.path.join(DOCS_DIR, filename)
-            
-            with open(file_abs_path, "wb") as bf:
-                bf.write(file_bytes)
-            
-            url_path = f"/static/docs/{filename}"
-            metadata.append({
-                "name": f.name,
-                "path": url_path,
-                "type": "pdf" if f.name.lower().endswith(".pdf") else "other"
-            })
-            
-            parts.append(types.Part(inline_data=types.Blob(mime_type=f.mime_type, data=file_bytes)))
-            logger.info(f"Persisted file: {f.name}")
-        except Exception as e:
-            logger.error(f"Failed to process file {f.name}: {e}")
+    results = await asyncio.gather(*[_persist_file(f, session_id) for f in files], return_exceptions=True)
+    for f, result in zip(files, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to process file {_upload_name(f)}: {result}")
+            continue
+        part, meta = result
+        parts.append(part)
+        metadata.append(meta)
             
     return parts, metadata
 
-@router.post("", response_model=ResearchResponse)
+@router.post("/upload")
+async def research_upload_endpoint(
+    query: str = Form(...),
+    sessionId: Optional[str] = Form(None),
+    radarId: Optional[str] = Form(None),
+    activeDocumentUrl: Optional[str] = Form(None),
+    agent_type: Optional[str] = Form('exploration'),
+    files: List[UploadFile] = File(default=[]),
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Multipart variant of the research endpoint. Files arrive as raw bytes,
+    avoiding the base64 inflation and decode of the JSON payload.
+    """
+    request = ResearchRequest(
+        query=query,
+        sessionId=sessionId,
+        radarId=radarId,
+        activeDocumentUrl=activeDocumentUrl,
+        agent_type=agent_type
+    )
+    return await _run_research(request, files, user_id)
+
+@router.post("")
 async def research_endpoint(request: ResearchRequest, user_id: str = Depends(get_current_user)):
+    return await _run_research(request, request.files, user_id)
+
+def _ndjson(payload: Dict[str, Any]) -> bytes:
+    return orjson.dumps(payload) + b"\n"
+
+def _event_text(event: Any) -> str:
+    """Returns the visible text of an agent event."""
+    text = ""
+    c = getattr(event, "content", None)
+    if c and hasattr(c, "parts"):
+        text = "\n".join([p.text for p in c.parts or [] if p.text])
+    if not text:
+        text = getattr(event, "text", "") or getattr(event, "output", "") or ""
+    return text
+
+def _static_file(path: str, folder: str) -> Dict[str, str]:
+    return {"path": path, "type": _STATIC_FOLDER_TYPES[folder], "name": path.rsplit("/", 1)[1]}
+
+def _collect_files(generated_files: List[str], streamed_files: Dict[str, Dict[str, str]]) -> List[Dict[str, str]]:
+    """Maps generated_files state plus the media files already streamed to response file entries."""
+    # Keyed by path, so duplicates are dropped
+    files = {}
+    for f in generated_files:
+        filename = os.path.basename(f)
+        ext = os.path.splitext(filename)[1].lower()
+        files[f"/static/{filename}"] = {"path": f"/static/{filename}", "type": FILE_TYPES_BY_EXT.get(ext, "video"), "name": filename}
+
+    # Files the agent referenced in any reply, including sub-agents'; tool outputs only reach the client this way
+    for path, entry in streamed_files.items():
+        if path not in files:
+            files[path] = entry
+    return list(files.values())
+
+async def _run_research(request: ResearchRequest, uploads: List[Union[FileUpload, UploadFile]], user_id: str) -> StreamingResponse:
+    """
+    Prepares the session and message for a research request, then streams the agent's
+    progress back as NDJSON (see _stream_research).
+    """
     target_app_name, target_app = get_agent_context(request.agent_type)
     current_user_id.set(user_id)
     logger.info(f"Research request: {target_app_name} | {request.query}")
+
+    if sum(_upload_size(f) for f in uploads) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Attached files exceed {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
     
     try:
-        # 1. Session Management
+        # 1-3. Session Management, Context Prompt and File Uploads are independent, so they run concurrently
         session_id = request.sessionId or str(uuid.uuid4())
-        await _get_or_create_session(user_id, session_id, target_app_name, request.query, request.radarId)
-
-        # 2. Build Context Prompt
-        query_text = await _build_context_prompt(user_id, request.query, request.radarId, request.activeDocumentUrl)
+        session, query_text, (file_parts, file_metadata) = await asyncio.gather(
+            _get_or_create_session(user_id, session_id, target_app_name, request.query, request.radarId),
+            _build_context_prompt(user_id, request.query, request.radarId, request.activeDocumentUrl),
+            _process_uploaded_files(uploads, session_id)
+        )
         parts = [types.Part(text=query_text)]
-
-        # 3. Handle File Uploads
-        file_parts, file_metadata = await _process_uploaded_files(request.files, session_id)
         parts.extend(file_parts)
 
-        # Update session with file metadata if present
+        state = (session.state if session else None) or {}
+        # All state changes for this request are collected here and written once
+        state_update = {}
+        if request.radarId and state.get("radar_id") != request.radarId:
+            state_update["radar_id"] = request.radarId
+
+        # Merge file metadata with the uploads already recorded on the session
         if file_metadata:
-            try:
-                curr_session = await session_service.get_session(user_id=user_id, session_id=session_id, app_name=target_app_name)
-                # Merge with existing
-                existing = curr_session.state.get("uploaded_files", []) or []
+            existing = list(state.get("uploaded_files", []) or [])
+            # uploaded_paths mirrors the paths in uploaded_files; older sessions predate it
+            if "uploaded_paths" in state:
+                existing_paths = set(state.get("uploaded_paths") or [])
+            else:
                 existing_paths = {u.get("path") for u in existing if isinstance(u, dict)}
-                for m in file_metadata:
-                    if m["path"] not in existing_paths:
-                        existing.append(m)
-                
+            for m in file_metadata:
+                if m["path"] not in existing_paths:
+                    existing.append(m)
+                    existing_paths.add(m["path"])
+            state_update["uploaded_files"] = existing
+            state_update["uploaded_paths"] = list(existing_paths)
+
+        if state_update:
+            try:
                 await session_service.update_session(
                     user_id=user_id, session_id=session_id, app_name=target_app_name, 
-                    state_update={"uploaded_files": existing}
+                    state_update=state_update
                 )
             except Exception as e:
-                logger.warning(f"Failed to update session file metadata: {e}")
+                logger.warning(f"Failed to update session state: {e}")
 
-        # 4. Run Agent
-        runner = Runner(app=target_app, session_service=session_service)
-        content = types.Content(parts=parts)
-
-        async for _ in runner.run_async(user_id=user_id, session_id=session_id, new_message=content):
-            pass 
-
-        # 5. Extract Response
-        session = await session_service.get_session(user_id=user_id, session_id=session_id, app_name=target_app_name)
-        response_text = ""
-        generated_files = []
-        
-        if session and session.events:
-            for event in reversed(session.events):
-                if getattr(event, "role", None) == "assistant" or (hasattr(event, "content") and event.content):
-                    # Extract text
-                    c = getattr(event, "content", None)
-                    if c and hasattr(c, "parts"):
-                        response_text = "\n".join([p.text for p in c.parts if p.text])
-                    if not response_text:
-                        response_text = getattr(event, "text", "") or getattr(event, "output", "") or ""
-                    break
-            
-            if session.state:
-                generated_files = session.state.get("generated_files", [])
-
-        # Map to response model
-        files = []
-        for f in generated_files:
-            filename = os.path.basename(f)
-            ft = "presentation" if filename.endswith(".pptx") else "audio" if filename.endswith(".mp3") else "video"
-            files.append(FileItem(path=f"/static/{filename}", type=ft, name=filename))
-            
+    except Exception as e:
+        logger.error(f"Error processing research request: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # 4. Run Agent, detached from the connection so a disconnect doesn't abort tool work or the final flush
+    runner = _get_runner(target_app)
+    content = types.Content(parts=parts)
+    generated_files = state.get("generated_files", []) or []
+    updates: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(_run_agent(runner, user_id, session_id, content, generated_files, updates))
+    _agent_runs.add(task)
+    task.add_done_callback(_agent_runs.discard)
+    return StreamingResponse(_stream_updates(updates), media_type="application/x-ndjson")
+
+async def _stream_updates(updates: asyncio.Queue):
+    """Relays the agent run's NDJSON lines to the client until the run ends."""
+    while True:
+        line = await updates.get()
+        if line is None:
+            return
+        yield line
+
+async def _run_agent(runner: Runner, user_id: str, session_id: str, content: types.Content, generated_files: List[str], updates: asyncio.Queue) -> None:
+    """
+    Runs the agent to completion, putting one JSON line per update on `updates`:
+    {"event": "text"} with the latest agent text, {"event": "file"} for each media path
+    as it first appears, then {"event": "done"} with the final content and every file announced, or
+    {"event": "error"} with a detail message, followed by None. The queue is unbounded,
+    so the run never waits on the client.
+    """
+    response_text = ""
+    # path -> file entry for every media path sent as a "file" update
+    streamed_files = {}
+    try:
+        async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=content):
+            if getattr(event, "partial", False):
+                continue
+            state_delta = getattr(getattr(event, "actions", None), "state_delta", None)
+            if state_delta and "generated_files" in state_delta:
+                generated_files = state_delta["generated_files"] or []
+            if not (getattr(event, "role", None) == "assistant" or getattr(event, "content", None)):
+                continue
+            text = _event_text(event)
+            if not text:
+                continue
+            response_text = text
+            updates.put_nowait(_ndjson({"event": "text", "text": text}))
+            if len(text) < _MIN_STATIC_PATH_LEN or "static/" not in text:
+                continue
+            for m in _STATIC_FILE_RE.finditer(text):
+                path = "/" + m.group(0)
+                if path not in streamed_files:
+                    streamed_files[path] = _static_file(path, m.group(1))
+                    updates.put_nowait(_ndjson({"event": "file", **streamed_files[path]}))
+
+        # Persist coalesced events before finishing; background work may be throttled afterwards
+        flush_fn = getattr(session_service, "flush", None)
+        if flush_fn:
+            await flush_fn(session_id)
+
+        # 5. Final response
+        files = _collect_files(generated_files, streamed_files)
         logger.info(f"Request complete. Generated {len(files)} files.")
-        return ResearchResponse(content=response_text, files=files)
+        updates.put_nowait(_ndjson({"event": "done", "content": response_text, "files": files}))
 
     except Exception as e:
         logger.error(f"Error processing research request: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+        updates.put_nowait(_ndjson({"event": "error", "detail": str(e)}))
+    finally:
+        updates.put_nowait(None)
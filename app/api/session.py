@@ -2,15 +2,47 @@ import logging
 import os
 import json
 import re
-from typing import Optional, Dict, Any, List
-from fastapi import APIRouter, HTTPException, Depends
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Iterator, List
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import ORJSONResponse
 from app.core.auth import get_current_user
 from app.core.session_storage import session_service
+from app.core.config import FILE_TYPES_BY_EXT
 from app.agent import app as adk_app, get_agent_context
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Default app that sessions created before per-agent apps were stored under
+_ADK_APP_NAME = adk_app.name
+
+# Text substituted for file parts whose data was scrubbed before storage
+_PLACEHOLDER = "[External file data not preserved in history]"
+
+# Author substrings -> message role
+_AUTHOR_ROLE_RE = re.compile(r"user|assistant|model|aletheia|system|tool")
+_AUTHOR_ROLES = {
+    "user": "user",
+    "assistant": "assistant",
+    "model": "assistant",
+    "aletheia": "assistant",
+    "system": "system",
+    "tool": "tool",
+}
+_VALID_ROLES = frozenset(("user", "assistant", "system", "tool"))
+# Event types that mark user input, and the thought marker checked in event text
+_USER_ROLE_RE = re.compile(r"user|input|request")
+_THOUGHT_RE = re.compile(r"thought", re.IGNORECASE)
+_USER_FACING_TOOLS = ("generate_audio_summary", "generate_presentation_file", "generate_video_lecture_file")
+_MEDIA_SUFFIXES = (".mp3", ".pptx", ".mp4")
+_USER_QUERY_RE = re.compile(r"User Query:\s*(.*)", re.DOTALL)
+
+# Serialized history payloads keyed by (user_id, app_name, session_id, etag), least recently used first
+_HISTORY_CACHE_SIZE = 256
+_history_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+
 async def _resolve_session(user_id: str, session_id: str, app_name: str) -> Optional[Any]:
     """Retrieves session with fallback to default app context."""
     try:
@@ -20,33 +52,42 @@ async def _resolve_session(user_id: str, session_id: str, app_name: str) -> Opti
             
         # Fallback to default app
         try:
-             return await session_service.get_session(user_id=user_id, session_id=session_id, app_name=adk_app.name)
+             return await session_service.get_session(user_id=user_id, session_id=session_id, app_name=_ADK_APP_NAME)
         except:
              return None
     except Exception as e:
         logger.warning(f"Error resolving session {session_id}: {e}")
         return None
 
-def _extract_text_from_event(event: Any) -> str:
-    """Extracts and sanitizes text from a session event."""
-    text = ""
+def _scan_event_parts(event: Any) -> tuple[List[str], int]:
+    """Single pass over an event's content parts: returns (visible text parts, attached file count)."""
+    text_parts = []
+    scrubbed_count = 0
     content = getattr(event, "content", None)
+    parts = getattr(content, "parts", None) if content else None
     
-    if content:
-        parts = getattr(content, "parts", None)
-        if parts:
-            text_parts = []
-            for p in parts:
-                p_text = getattr(p, "text", "")
-                p_text_str = str(p_text or "")
-                # Filter out scrubbed file placeholder
-                if p_text_str and "[External file data not preserved in history]" not in p_text_str:
-                    text_parts.append(p_text_str)
-            text = "\n".join(text_parts)
+    for p in parts or ():
+        # Uploaded files are stored in full; count them for upload matching
+        if getattr(p, "inline_data", None) is not None:
+            scrubbed_count += 1
+            continue
+        p_text = str(getattr(p, "text", "") or "")
+        if not p_text:
+            continue
+        # Legacy scrubbed file placeholders are counted the same way, not shown as text
+        if _PLACEHOLDER in p_text:
+            scrubbed_count += 1
+        else:
+            text_parts.append(p_text)
+    return text_parts, scrubbed_count
+
+def _extract_text_from_event(event: Any, text_parts: List[str]) -> str:
+    """Joins the event's visible text parts, falling back to raw text/output attributes."""
+    text = "\n".join(text_parts)
     
     if not text:
         raw_text = getattr(event, "text", "") or getattr(event, "output", "") or ""
-        if "[External file data not preserved in history]" not in str(raw_text):
+        if _PLACEHOLDER not in str(raw_text):
             text = raw_text
             
     return text
@@ -58,11 +99,8 @@ def _determine_message_role(event: Any, text: str) -> str:
     # 1. Check direct 'author' attribute
     author = getattr(event, "author", None)
     if author:
-        author_str = str(author).lower()
-        if "user" in author_str: return "user"
-        if any(m in author_str for m in ("assistant", "model", "aletheia")): return "assistant"
-        if "system" in author_str: return "system"
-        if "tool" in author_str: return "tool"
+        match = _AUTHOR_ROLE_RE.search(str(author).lower())
+        if match: return _AUTHOR_ROLES[match.group(0)]
 
     # 2. Check 'role' attribute
     if not role:
@@ -76,19 +114,19 @@ def _determine_message_role(event: Any, text: str) -> str:
         if isinstance(role, str): role = role.lower()
 
     # 4. Final heuristic fallback
-    if role not in ("user", "assistant", "system", "tool"):
+    if role not in _VALID_ROLES:
         event_type = str(getattr(event, "type", "") or getattr(event, "event_type", "")).lower()
-        if any(k in event_type for k in ("user", "input", "request")):
+        if _USER_ROLE_RE.search(event_type):
             role = "user"
-        elif "thought" in text.lower() or "thinking" in event_type or "tool" in event_type:
+        elif "thinking" in event_type or "tool" in event_type or _THOUGHT_RE.search(text):
             # Check for user-facing tool outputs
             is_user_facing = False
             tool_name = getattr(event, "tool_name", "") or getattr(event, "function_name", "") or ""
             
-            if any(t in tool_name for t in ["generate_audio_summary", "generate_presentation_file", "generate_video_lecture_file"]):
+            if any(t in tool_name for t in _USER_FACING_TOOLS):
                 is_user_facing = True
             
-            if text.strip().endswith(".mp3") or text.strip().endswith(".pptx") or text.strip().endswith(".mp4"):
+            if text.strip().endswith(_MEDIA_SUFFIXES):
                 if "/static/" in text or "http" in text:
                     is_user_facing = True
 
@@ -103,46 +141,52 @@ def _sanitize_user_text(text: str) -> str:
     if "SYSTEM DIRECTIVE:" in text:
         return "" 
     elif "CONTEXT:" in text and "User Query:" in text:
-        match = re.search(r"User Query:\s*(.*)", text, re.DOTALL)
+        match = _USER_QUERY_RE.search(text)
         if match:
             return match.group(1).strip()
     return text
 
-def _match_files_to_message(role: str, event: Any, unassigned_uploads: list, unassigned_generated: list, text: str) -> list:
-    """Matches uploaded or generated files to the current message."""
+def _to_url(path: str) -> str:
+    """Makes a stored file path absolute for the frontend."""
+    return path if path.startswith("/") or "://" in path else f"/{path}"
+
+def _normalize_generated_file(f: Any) -> Optional[Dict[str, Any]]:
+    """Resolves a generated-file entry (bare path or dict) to its URL, name and type once per request."""
+    path = f if isinstance(f, str) else f.get("path") if isinstance(f, dict) else None
+    if not path:
+        return None
+    name = os.path.basename(path) if isinstance(f, str) else f.get("name", os.path.basename(path))
+    is_pdf = FILE_TYPES_BY_EXT.get(os.path.splitext(path)[1].lower()) == "pdf"
+    return {
+        "path": _to_url(path),
+        "name": name,
+        "type": "pdf" if is_pdf else "other",
+        "is_document": is_pdf or (isinstance(f, dict) and f.get("type") == "pdf")
+    }
+
+def _match_files_to_message(role: str, scrubbed_count: int, unassigned_uploads: Iterator, unassigned_generated: Iterator, text: str) -> list:
+    """
+    Matches uploaded or generated files to the current message.
+    The pools are shared iterators over the session's file lists, so assigned files are consumed in order.
+    """
     msg_files = []
-    content = getattr(event, "content", None)
     
     # 1. Match Uploaded Files (User role)
-    if role == "user" and content:
-        scrubbed_count = 0
-        for p in getattr(content, "parts", []):
-            p_val = getattr(p, "text", "")
-            if "[External file data not preserved in history]" in str(p_val or ""):
-                scrubbed_count += 1
-        
-        for _ in range(scrubbed_count):
-            if unassigned_uploads:
-                up = unassigned_uploads.pop(0)
-                if isinstance(up, dict):
-                    msg_files.append({
-                        "path": up.get("path"),
-                        "type": "pdf" if up.get("path", "").lower().endswith(".pdf") else "other",
-                        "name": up.get("name")
-                    })
+    # Upload metadata is stored with its final URL path and type, so it is used as-is
+    if role == "user":
+        for _, up in zip(range(scrubbed_count), unassigned_uploads):
+            if isinstance(up, dict):
+                msg_files.append({
+                    "path": up.get("path"),
+                    "type": up.get("type", "other"),
+                    "name": up.get("name")
+                })
 
     # 2. Match Generated Files (Assistant role)
-    if role == "assistant" and unassigned_generated:
+    if role == "assistant":
         if text.strip() == "Research synthesis complete." or "report" in text.lower():
-            while unassigned_generated:
-                f = unassigned_generated.pop(0)
-                path = f if isinstance(f, str) else f.get("path")
-                name = os.path.basename(path) if isinstance(f, str) else f.get("name", os.path.basename(path))
-                msg_files.append({
-                    "path": path if path.startswith("/") or "://" in path else f"/{path}",
-                    "type": "pdf" if path.lower().endswith(".pdf") else "other",
-                    "name": name
-                })
+            for f in unassigned_generated:
+                msg_files.append({"path": f["path"], "type": f["type"], "name": f["name"]})
     return msg_files
 
 def _collect_session_docs(gen_files: list, uploaded_files: list) -> list:
@@ -151,48 +195,42 @@ def _collect_session_docs(gen_files: list, uploaded_files: list) -> list:
     
     # Generated files
     for f in gen_files:
-        path = f if isinstance(f, str) else f.get("path")
-        name = os.path.basename(path) if isinstance(f, str) else f.get("name", os.path.basename(path))
-        if path and (path.lower().endswith(".pdf") or (isinstance(f, dict) and f.get("type") == "pdf")):
-            all_docs.append({
-                "name": name,
-                "url": path if path.startswith("/") or "://" in path else f"/{path}"
-            })
+        if f["is_document"]:
+            all_docs.append({"name": f["name"], "url": f["path"]})
     
     # Uploaded files
     for f in uploaded_files:
         if isinstance(f, dict) and f.get("type") == "pdf":
-            path = f.get("path")
-            all_docs.append({
-                "name": f.get("name"),
-                "url": path if path.startswith("/") or "://" in path else f"/{path}"
-            })
+            all_docs.append({"name": f.get("name"), "url": f.get("path")})
             
     return all_docs
 
-@router.get("/{session_id}")
-async def get_session_history(session_id: str, agent_type: Optional[str] = 'exploration', user_id: str = Depends(get_current_user)):
-    target_app_name, _ = get_agent_context(agent_type)
-    
-    session = await _resolve_session(user_id, session_id, target_app_name)
-    if not session:
-        return {"messages": []}
-    
-    # Prepare pools
+def _history_etag(session: Any) -> str:
+    """Weak ETag that changes whenever events or the session's file lists change."""
+    events = session.events or []
+    last_id = events[-1].id if events else 0
+    state = session.state or {}
+    gen_count = len(state.get("generated_files") or [])
+    upload_count = len(state.get("uploaded_files") or [])
+    return f'W/"{len(events)}-{last_id}-{gen_count}-{upload_count}"'
+
+def _build_history(session: Any) -> Dict[str, Any]:
+    """Reconstructs the chat messages and session documents from the stored events."""
     history = []
-    gen_files = session.state.get("generated_files", []) or []
+    gen_files = [g for g in map(_normalize_generated_file, session.state.get("generated_files", []) or []) if g]
     uploaded_files = session.state.get("uploaded_files", []) or []
-    unassigned_uploads = list(uploaded_files)
-    unassigned_generated = list(gen_files)
+    unassigned_uploads = iter(uploaded_files)
+    unassigned_generated = iter(gen_files)
     
-    logger.info(f"Loading history for session {session_id}. State has {len(uploaded_files)} uploads and {len(gen_files)} generated files.")
+    logger.info(f"Loading history for session {session.id}. State has {len(uploaded_files)} uploads and {len(gen_files)} generated files.")
     
     for event in session.events:
-        text = _extract_text_from_event(event)
+        text_parts, scrubbed_count = _scan_event_parts(event)
+        text = _extract_text_from_event(event, text_parts)
         role = _determine_message_role(event, text)
         if role not in ("user", "assistant"):
             continue   
-        msg_files = _match_files_to_message(role, event, unassigned_uploads, unassigned_generated, text)
+        msg_files = _match_files_to_message(role, scrubbed_count, unassigned_uploads, unassigned_generated, text)
         if role == "user":
             text = _sanitize_user_text(text)
         if not text.strip() and not msg_files:
@@ -209,3 +247,34 @@ async def get_session_history(session_id: str, agent_type: Optional[str] = 'expl
         "messages": history,
         "documents": _collect_session_docs(gen_files, uploaded_files)
     }
+
+@router.get("/{session_id}")
+async def get_session_history(session_id: str, request: Request, agent_type: Optional[str] = 'exploration', user_id: str = Depends(get_current_user)):
+    target_app_name, _ = get_agent_context(agent_type)
+    
+    session = await _resolve_session(user_id, session_id, target_app_name)
+    if not session:
+        return ORJSONResponse({"messages": []})
+    
+    # Fresh sessions have nothing to reconstruct
+    state = session.state or {}
+    if not session.events and not state.get("generated_files") and not state.get("uploaded_files"):
+        return ORJSONResponse({"messages": [], "documents": []})
+    
+    # Unchanged sessions are answered from the client's copy or the payload cache
+    etag = _history_etag(session)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    cache_key = (user_id, session.app_name, session_id, etag)
+    body = _history_cache.get(cache_key)
+    if body is not None:
+        _history_cache.move_to_end(cache_key)
+    else:
+        body = orjson.dumps(_build_history(session))
+        _history_cache[cache_key] = body
+        if len(_history_cache) > _HISTORY_CACHE_SIZE:
+            _history_cache.popitem(last=False)
+    
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,6 +1,11 @@
+import time
+import hashlib
 import logging
-from typing import Optional
-from fastapi import APIRouter, HTTPException, Depends
+from collections import OrderedDict
+from typing import List, Optional
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import ORJSONResponse
 from app.core.auth import get_current_user
 from app.core.session_storage import session_service
 from app.agent import app as adk_app, get_agent_context
@@ -8,9 +13,24 @@ from app.agent import app as adk_app, get_agent_context
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Default app that sessions created before per-agent apps were stored under
+_ADK_APP_NAME = adk_app.name
+
+# (user_id, app_name, radar_id) -> (expires_at, etag, body); thread lists change slowly,
+# so they are served from here for a few seconds and revalidated with ETags
+_THREADS_CACHE_TTL = 10
+_THREADS_CACHE_SIZE = 1024
+_threads_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+def invalidate_threads_cache(user_id: str) -> None:
+    """Drops cached thread lists for a user, e.g. after a thread is created or deleted."""
+    for key in [k for k in _threads_cache if k[0] == user_id]:
+        del _threads_cache[key]
+
 @router.delete("/{session_id}")
 async def delete_thread(session_id: str, agent_type: Optional[str] = 'exploration', user_id: str = Depends(get_current_user)):
     target_app_name, _ = get_agent_context(agent_type)
+    invalidate_threads_cache(user_id)
     try:
         await session_service.delete_session(user_id=user_id, session_id=session_id, app_name=target_app_name)
         return {"status": "success", "message": f"Thread {session_id} deleted"}
@@ -18,72 +38,78 @@ async def delete_thread(session_id: str, agent_type: Optional[str] = 'exploratio
         logger.error(f"Error deleting thread {session_id}: {e}")
         # Try finding in default app just in case
         try:
-            await session_service.delete_session(user_id=user_id, session_id=session_id, app_name=adk_app.name)
+            await session_service.delete_session(user_id=user_id, session_id=session_id, app_name=_ADK_APP_NAME)
         except Exception:
             pass
         raise HTTPException(status_code=500, detail=str(e))
 
+# Internal/system sessions hidden from the thread list
+_HIDDEN_TITLE_PREFIXES = ("System sweeping", "System thinking")
+
+def _session_id(s) -> Optional[str]:
+    if isinstance(s, dict):
+        return s.get("session_id") or s.get("id")
+    return getattr(s, "session_id", None) or getattr(s, "id", None)
+
+def _to_thread(s) -> Optional[dict]:
+    """Maps a listed session (dict summary or Session) to a thread entry, or None if it is hidden."""
+    if isinstance(s, dict):
+        raw_state = s.get("state") or {}
+        title = raw_state.get("title") or s.get("title") or "Untitled Research"
+    else:
+        raw_state = getattr(s, "state", None) or {}
+        title = (raw_state.get("title") if isinstance(raw_state, dict) else None) or getattr(s, "title", None) or "Untitled Research"
+    session_id = _session_id(s)
+
+    # Filter out internal/system sessions: sync_* ids and system sweeping/thinking titles
+    if not session_id or str(session_id).startswith("sync_") or str(title).startswith(_HIDDEN_TITLE_PREFIXES):
+        return None
+    return {"id": session_id, "title": title, "radarId": raw_state.get("radar_id")}
+
+async def _list_threads(user_id: str, target_app_name: str, radar_id: Optional[str]) -> List[dict]:
+    # Prefer the projected listing: threads only need each session's id, title and radar
+    session_list_fn = getattr(session_service, "list_session_summaries", None) or getattr(session_service, "list_sessions_for_user", None)
+
+    if not callable(session_list_fn):
+        return []
+
+    sessions = await session_list_fn(user_id=user_id, app_name=target_app_name, radar_id=radar_id) or []
+
+    # Merge legacy sessions (from default 'Aletheia' app scope) to prevent history loss
+    if target_app_name != _ADK_APP_NAME:
+        try:
+            legacy_sessions = await session_list_fn(user_id=user_id, app_name=_ADK_APP_NAME, radar_id=radar_id)
+            # Deduplicate based on session ID
+            existing_ids = {sid for sid in map(_session_id, sessions) if sid}
+            sessions = list(sessions)
+            sessions.extend(ls for ls in legacy_sessions or [] if (ls_id := _session_id(ls)) and ls_id not in existing_ids)
+        except Exception as ex:
+            logger.warning(f"Failed to fetch legacy threads: {ex}")
+
+    return [t for t in map(_to_thread, sessions) if t]
+
 @router.get("")
-async def get_user_threads(radar_id: Optional[str] = None, agent_type: Optional[str] = 'exploration', user_id: str = Depends(get_current_user)):
+async def get_user_threads(request: Request, radar_id: Optional[str] = None, agent_type: Optional[str] = 'exploration', user_id: str = Depends(get_current_user)):
     target_app_name, _ = get_agent_context(agent_type)
-    try:
-        threads = []
-        session_list_fn = getattr(session_service, "list_sessions_for_user", None)
-
-        if callable(session_list_fn):
-            sessions = await session_list_fn(user_id=user_id, app_name=target_app_name, radar_id=radar_id)
-            
-            # Merge legacy sessions (from default 'Aletheia' app scope) to prevent history loss
-            if target_app_name != adk_app.name:
-                try:
-                    legacy_sessions = await session_list_fn(user_id=user_id, app_name=adk_app.name, radar_id=radar_id)
-                    # Deduplicate based on session ID
-                    if sessions is None:
-                        sessions = []
-                    existing_ids = set()
-                    for s in sessions:
-                        sid = getattr(s, "session_id", None) or getattr(s, "id", None)
-                        if isinstance(s, dict):
-                            sid = s.get("session_id") or s.get("id")
-                        if sid:
-                            existing_ids.add(sid)
-                            
-                    for ls in legacy_sessions or []:
-                        ls_id = getattr(ls, "session_id", None) or getattr(ls, "id", None)
-                        if isinstance(ls, dict):
-                            ls_id = ls.get("session_id") or ls.get("id")
-                        
-                        if ls_id and ls_id not in existing_ids:
-                            sessions.append(ls)
-                except Exception as ex:
-                    logger.warning(f"Failed to fetch legacy threads: {ex}")
-
-            for s in sessions or []:
-                if isinstance(s, dict):
-                    raw_state = s.get("state") or {}
-                    session_id = s.get("session_id") or s.get("id")
-                    title = raw_state.get("title") or s.get("title") or "Untitled Research"
-                else:
-                    raw_state = getattr(s, "state", None) or {}
-                    session_id = getattr(s, "session_id", None) or getattr(s, "id", None)
-                    title = (raw_state.get("title") if isinstance(raw_state, dict) else None) or getattr(s, "title", None) or "Untitled Research"
-
-                if session_id:
-                    # Filter out internal/system sessions
-                    # 1. Check ID pattern (sync_*)
-                    if str(session_id).startswith("sync_"):
-                        continue
-                    # 2. Check Title pattern (System sweeping/thinking)
-                    if str(title).startswith("System sweeping") or str(title).startswith("System thinking"):
-                        continue
-
-                    threads.append({
-                        "id": session_id, 
-                        "title": title,
-                        "radarId": raw_state.get("radar_id")
-                    })
-            return {"threads": threads}
-        return {"threads": []}
-    except Exception as e:
-        logger.error(f"Error fetching threads: {e}")
-        return {"threads": []}
+    cache_key = (user_id, target_app_name, radar_id)
+    cached = _threads_cache.get(cache_key)
+    if cached is not None and cached[0] > time.monotonic():
+        _, etag, body = cached
+    else:
+        try:
+            threads = await _list_threads(user_id, target_app_name, radar_id)
+        except Exception as e:
+            logger.error(f"Error fetching threads: {e}")
+            return ORJSONResponse({"threads": []})
+        body = orjson.dumps({"threads": threads})
+        etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        _threads_cache[cache_key] = (time.monotonic() + _THREADS_CACHE_TTL, etag, body)
+        _threads_cache.move_to_end(cache_key)
+        if len(_threads_cache) > _THREADS_CACHE_SIZE:
+            _threads_cache.popitem(last=False)
+
+    # Clients always revalidate; unchanged lists cost a 304 with no body
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,5 +1,9 @@
 import os
+import time
+import hashlib
+import asyncio
 import logging
+from collections import OrderedDict
 from fastapi import Header, HTTPException, Depends
 import firebase_admin
 from firebase_admin import auth as firebase_auth
@@ -16,6 +20,31 @@ except ValueError:
     else:
         firebase_admin.initialize_app()
 
+# Token digest -> (uid, expires_at). Entries live at most _TOKEN_CACHE_TTL seconds and never past
+# the token's own exp claim; keys are hashed so raw tokens are not kept in memory.
+_TOKEN_CACHE_SIZE = 10_000
+_TOKEN_CACHE_TTL = 60
+_token_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+async def _verify_token(token: str) -> str:
+    """Returns the uid for a Firebase ID token, skipping re-verification of recently seen tokens."""
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    now = time.time()
+    cached = _token_cache.get(key)
+    if cached is not None:
+        uid, expires_at = cached
+        if expires_at > now:
+            _token_cache.move_to_end(key)
+            return uid
+        del _token_cache[key]
+    # Signature verification is blocking CPU work (and a key fetch on first use); keep it off the event loop
+    decoded_token = await asyncio.to_thread(firebase_auth.verify_id_token, token)
+    uid = decoded_token.get("uid", "unknown_user")
+    _token_cache[key] = (uid, min(decoded_token.get("exp", 0), time.time() + _TOKEN_CACHE_TTL))
+    if len(_token_cache) > _TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return uid
+
 async def get_current_user(authorization: str = Header(None)):
     """
     Verifies the Firebase ID token sent from the frontend.
@@ -43,8 +72,7 @@ async def get_current_user(authorization: str = Header(None)):
                 detail="Invalid authorization scheme. Expected 'Bearer'.",
             )
         # Verify the ID token using Firebase Admin SDK
-        decoded_token = firebase_auth.verify_id_token(token)
-        return decoded_token.get("uid", "unknown_user")
+        return await _verify_token(token)
     except HTTPException:
         # Re-raise HTTPExceptions unchanged
         raise
@@ -8,9 +8,21 @@ AUDIO_DIR = os.path.join(STATIC_DIR, "audio")
 SLIDES_DIR = os.path.join(STATIC_DIR, "slides")
 VIDEO_DIR = os.path.join(STATIC_DIR, "videos")
 
-# Ensure directories exist
+# Ensure the static root exists (it is mounted at startup); subdirectories are created on first write
 os.makedirs(STATIC_DIR, exist_ok=True)
-os.makedirs(DOCS_DIR, exist_ok=True)
+
+# File extension -> file type reported to the frontend
+FILE_TYPES_BY_EXT = {
+    ".pdf": "pdf",
+    ".pptx": "presentation",
+    ".mp3": "audio",
+    ".mp4": "video",
+    ".webm": "video",
+}
+
+# Cap on the combined decoded size of files attached to one research request. Files are sent
+# inline to Gemini, whose 20 MB request limit applies after base64 (4/3) inflation.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "14")) * 1024 * 1024
 
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
 
@@ -0,0 +1,26 @@
+import os
+import logging
+from google.cloud import firestore
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+def get_firestore_client() -> firestore.AsyncClient:
+    """
+    Returns the process-wide Firestore AsyncClient, creating it on first use.
+    Sharing one client reuses its gRPC channel and credentials across services.
+    """
+    global _client
+    if _client is None:
+        database_id = os.getenv("FIREBASE_DATABASE_ID", "(default)")
+        project_id = os.getenv("VITE_FIREBASE_PROJECT_ID")
+
+        key_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "gcp-sa-key.json")
+        if os.path.exists(key_path):
+            _client = firestore.AsyncClient.from_service_account_json(key_path, database=database_id)
+            logger.info(f"Initialized Firestore Client using {key_path}")
+        else:
+            logger.info(f"Connecting to Firestore database: {database_id}")
+            _client = firestore.AsyncClient(database=database_id, project=project_id)
+    return _client
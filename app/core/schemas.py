@@ -43,9 +43,14 @@ class RadarUpdate(BaseModel):
     status: Optional[str] = None
     arxivConfig: Optional[ArxivConfig] = None
 
+class FileUpload(BaseModel):
+    name: str
+    mime_type: str
+    data: str # base64-encoded file content
+
 class ResearchRequest(BaseModel):
     query: str
-    files: List[dict] = []
+    files: List[FileUpload] = []
     sessionId: Optional[str] = None
     radarId: Optional[str] = None
     activeDocumentUrl: Optional[str] = None
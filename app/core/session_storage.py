@@ -1,47 +1,87 @@
-import os
+import asyncio
 import logging
 import datetime
-import json
+from collections import OrderedDict
+import orjson
+import zstandard as zstd
 from typing import List, Optional, Any, Dict
+from pydantic import TypeAdapter
 from google.cloud import storage
 from google.adk.sessions.base_session_service import BaseSessionService
 from google.adk.sessions.session import Session
 from google.adk.events.event import Event
+from google.genai import types
 from google.adk.sessions.in_memory_session_service import InMemorySessionService
 from app.core.config import PROJECT_ID, BUCKET_NAME
 
 
 logger = logging.getLogger(__name__)
 
-def scrub_blobs(obj):
+# Appended events are coalesced per session and written once per window,
+# or as soon as this many events are waiting.
+_FLUSH_DELAY_SECONDS = 0.1
+_FLUSH_MAX_EVENTS = 50
+
+# Events are stored in a "chunks" subcollection as an append-only log of segments:
+# each write adds one zstd-compressed JSON array of the new events, split across
+# documents to stay under Firestore's 1MB document limit. The last piece of a segment
+# carries end=True.
+_CHUNK_BYTES = 900 * 1024
+_CHUNKS_COLLECTION = "chunks"
+# Firestore rejects commits over 10 MiB, so large segments are written over several batches
+_CHUNKS_PER_COMMIT = 9
+# Uploaded files above this size are kept in /static/docs only; the stored event gets a text
+# placeholder, so sessions stay small and old files are not re-sent to the model every turn
+_MAX_STORED_BLOB_BYTES = 512 * 1024
+_SCRUBBED_FILE_TEXT = "[External file data not preserved in history]"
+# Sessions whose persisted (event count, chunk count) is known, so writes only append
+_WRITTEN_CACHE_SIZE = 1024
+_CCTX = zstd.ZstdCompressor(level=3)
+_DCTX = zstd.ZstdDecompressor()
+
+def _split_chunks(payload: bytes) -> List[bytes]:
+    """Splits a compressed segment into document-sized pieces."""
+    return [payload[i:i + _CHUNK_BYTES] for i in range(0, len(payload), _CHUNK_BYTES)]
+
+def _is_large_blob(part: types.Part) -> bool:
+    blob = part.inline_data
+    return blob is not None and blob.data is not None and len(blob.data) > _MAX_STORED_BLOB_BYTES
+
+def _without_large_blobs(event: Event) -> Event:
     """
-    Recursively removes large binary data (base64 strings) from the session 
-    to stay within Firestore's 1MB document limit.
+    Returns the event as it should be stored, with large inline file parts replaced by the
+    placeholder text. The live event is left untouched, since the current turn may still use it.
     """
-    if isinstance(obj, dict):
-        if "inline_data" in obj and isinstance(obj["inline_data"], dict):
-            blob = obj["inline_data"]
-            if "data" in blob and isinstance(blob["data"], str) and len(blob["data"]) > 1024:
-                # Use a valid base64 placeholder to avoid Pydantic validation errors on reload
-                # 'REFUQV9TVFJJUFBFRF9GT1JfU1RPUkFHRQ==' is base64 for 'DATA_STRIPPED_FOR_STORAGE'
-                blob["data"] = "REFUQV9TVFJJUFBFRF9GT1JfU1RPUkFHRQ=="
-        return {k: scrub_blobs(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [scrub_blobs(x) for x in obj]
-    return obj
+    parts = event.content.parts if event.content else None
+    if not parts or not any(_is_large_blob(p) for p in parts):
+        return event
+    parts = [types.Part(text=_SCRUBBED_FILE_TEXT) if _is_large_blob(p) else p for p in parts]
+    return event.model_copy(update={"content": event.content.model_copy(update={"parts": parts})})
+
+def _join_segments(segments: List[bytes]) -> bytes:
+    """Concatenates JSON arrays into a single array without parsing them."""
+    return b"[" + b",".join(seg[1:-1] for seg in segments if len(seg) > 2) + b"]"
+
+# Valid base64 placeholder for blobs stripped by older versions, so Pydantic validation passes on reload.
+# 'REFUQV9TVFJJUFBFRF9GT1JfU1RPUkFHRQ==' is base64 for 'DATA_STRIPPED_FOR_STORAGE'
+_STRIPPED_PLACEHOLDER = "REFUQV9TVFJJUFBFRF9GT1JfU1RPUkFHRQ=="
 
 def rescue_blobs(obj):
     """
-    Cleans up legacy invalid base64 placeholders to prevent validation crashes.
+    Cleans up legacy invalid base64 placeholders in place to prevent validation crashes.
     """
-    if isinstance(obj, dict):
-        if "inline_data" in obj and isinstance(obj["inline_data"], dict):
-            blob = obj["inline_data"]
-            if "data" in blob and isinstance(blob["data"], str) and blob["data"].startswith("[Data stripped"):
-                blob["data"] = "REFUQV9TVFJJUFBFRF9GT1JfU1RPUkFHRQ=="
-        return {k: rescue_blobs(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [rescue_blobs(x) for x in obj]
+    stack = [obj]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            blob = node.get("inline_data")
+            if isinstance(blob, dict):
+                data = blob.get("data")
+                if isinstance(data, str) and data.startswith("[Data stripped"):
+                    blob["data"] = _STRIPPED_PLACEHOLDER
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
     return obj
 
 def remove_scrubbed_parts(obj):
@@ -58,12 +98,12 @@ def remove_scrubbed_parts(obj):
                 if isinstance(part, dict):
                     if "inline_data" in part and isinstance(part["inline_data"], dict):
                         data = part["inline_data"].get("data")
-                        if data == "REFUQV9TVFJJUFBFRF9GT1JfU1RPUkFHRQ==":
+                        if data == _STRIPPED_PLACEHOLDER:
                             is_scrubbed = True
                 
                 if is_scrubbed:
                     # Replace the corrupted blob with a status message
-                    new_parts.append({"text": "[External file data not preserved in history]"})
+                    new_parts.append({"text": _SCRUBBED_FILE_TEXT})
                 else:
                     new_parts.append(remove_scrubbed_parts(part))
             obj["parts"] = new_parts
@@ -73,6 +113,27 @@ def remove_scrubbed_parts(obj):
         return [remove_scrubbed_parts(x) for x in obj]
     return obj
 
+_EVENTS_ADAPTER = TypeAdapter(List[Event])
+# Markers left in documents written before uploaded file data was kept
+_LEGACY_BLOB_MARKERS = (b"[Data stripped", _STRIPPED_PLACEHOLDER.encode("ascii"))
+
+def _session_from_doc(data: Dict[str, Any], raw_events: bytes) -> Session:
+    """
+    Builds a Session from its root document and serialized events.
+    Events are validated straight from the JSON bytes, skipping the intermediate dicts.
+    """
+    if any(marker in raw_events for marker in _LEGACY_BLOB_MARKERS):
+        data["events"] = orjson.loads(raw_events)
+        # Rescue legacy invalid base64 strings
+        data = rescue_blobs(data)
+        # Remove scrubbed file parts before inference
+        data = remove_scrubbed_parts(data)
+        return Session.model_validate(data)
+    data.pop("events", None)
+    session = Session.model_validate(data)
+    session.events = _EVENTS_ADAPTER.validate_json(raw_events)
+    return session
+
 class FirestoreSessionService(BaseSessionService):
     """
     Custom Firestore-backed session service for Aletheia.
@@ -81,33 +142,34 @@ class FirestoreSessionService(BaseSessionService):
     def __init__(self, collection_name="sessions"):
         try:
             from google.cloud import firestore
-            database_id = os.getenv("FIREBASE_DATABASE_ID", "(default)")
-            logger.info(f"Connecting to Firestore database: {database_id}")
-            self.db = firestore.AsyncClient(database=database_id)
+            from app.core.firestore_client import get_firestore_client
+            self.db = get_firestore_client()
             self.collection_name = collection_name
             self.firestore_module = firestore
+            # session_id -> (latest in-memory session, events appended since last write)
+            self._pending: Dict[str, tuple] = {}
+            self._flush_tasks: Dict[str, asyncio.Task] = {}
+            # session_id -> [lock, writers holding or waiting on it]; dropped when the last one finishes
+            self._write_locks: Dict[str, list] = {}
+            self._written: "OrderedDict[str, tuple]" = OrderedDict()
         except ImportError:
             logger.error("google-cloud-firestore not installed. FirestoreSessionService will not work.")
             raise
 
     async def get_session(self, *, user_id: str, session_id: str, app_name: str) -> Optional[Session]:
+        await self.flush(session_id)
         doc = await self.db.collection(self.collection_name).document(session_id).get()
         if doc.exists:
             data = doc.to_dict()
             if data.get("user_id") == user_id and data.get("app_name") == app_name:
-                # Deserialize events if they are stored as a JSON string
-                events_data = data.get("events")
-                if isinstance(events_data, str):
-                    try:
-                        data["events"] = json.loads(events_data)
-                    except Exception as e:
-                        logger.error(f"Failed to parse stringified events: {e}")
-                        data["events"] = []
-                # Rescue legacy invalid base64 strings
-                data = rescue_blobs(data)
-                # Remove scrubbed file parts before inference
-                data = remove_scrubbed_parts(data)
-                return Session.model_validate(data)
+                chunk_count = data.get("chunk_count")
+                # Load failures propagate: a session returned without its events would be
+                # written back over the persisted history on the next append
+                raw_events = await self._load_events(doc.reference, data)
+                session = _session_from_doc(data, raw_events)
+                if chunk_count is not None:
+                    self._remember_written(session_id, len(session.events), chunk_count)
+                return session
         return None
 
     async def create_session(self, *, user_id: str, session_id: str, app_name: str, state: Optional[Dict[str, Any]] = None, **kwargs) -> Session:
@@ -119,12 +181,7 @@ class FirestoreSessionService(BaseSessionService):
             events=[],
             last_update_time=datetime.datetime.now(datetime.timezone.utc).timestamp()
         )
-        data = session.model_dump(mode='json', exclude_none=True)
-        # Scrub large blobs to stay under 1MB limit
-        data = scrub_blobs(data)
-        # Stringify events to bypass Firestore's nested array limitation
-        data["events"] = json.dumps(data.get("events", []))
-        await self.db.collection(self.collection_name).document(session_id).set(data)
+        await self._write_session(session)
         return session
 
     async def append_event(self, *, session: Session, event: Event) -> Event:
@@ -133,17 +190,125 @@ class FirestoreSessionService(BaseSessionService):
         if hasattr(ts, 'timestamp'):
             ts = ts.timestamp()
         session.last_update_time = ts
-        
-        data = session.model_dump(mode='json', exclude_none=True)
-        # Scrub large blobs to stay under 1MB limit
-        data = scrub_blobs(data)
-        # Stringify events to bypass Firestore's nested array limitation
-        data["events"] = json.dumps(data.get("events", []))
-        
-        await self.db.collection(self.collection_name).document(session.id).set(data)
+
+        # Writes append every event not yet persisted, so a burst of appends
+        # collapses into a single write of one segment.
+        _, count = self._pending.get(session.id, (None, 0))
+        self._pending[session.id] = (session, count + 1)
+        if count + 1 >= _FLUSH_MAX_EVENTS:
+            await self.flush(session.id)
+        elif session.id not in self._flush_tasks:
+            self._flush_tasks[session.id] = asyncio.create_task(self._flush_later(session.id))
         return event
 
+    async def flush(self, session_id: str) -> None:
+        """Writes any events still waiting for this session."""
+        task = self._flush_tasks.pop(session_id, None)
+        if task:
+            # Still sleeping: the task removes itself from the map before writing.
+            task.cancel()
+        await self._write_pending(session_id)
+
+    async def _flush_later(self, session_id: str) -> None:
+        await asyncio.sleep(_FLUSH_DELAY_SECONDS)
+        self._flush_tasks.pop(session_id, None)
+        try:
+            await self._write_pending(session_id)
+        except Exception as e:
+            logger.error(f"Failed to flush events for session {session_id}: {e}")
+
+    async def _write_pending(self, session_id: str) -> None:
+        entry = self._write_locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                session, count = self._pending.pop(session_id, (None, 0))
+                if session is None:
+                    return
+                try:
+                    await self._write_session(session)
+                except ValueError:
+                    # Never writable, so not retried
+                    raise
+                except Exception:
+                    # Keep the events queued so the next flush retries them
+                    if session_id not in self._pending:
+                        self._pending[session_id] = (session, count)
+                    raise
+        finally:
+            entry[1] -= 1
+            if not entry[1] and self._write_locks.get(session_id) is entry:
+                del self._write_locks[session_id]
+
+    def _remember_written(self, session_id: str, event_count: int, chunk_count: int) -> None:
+        self._written[session_id] = (event_count, chunk_count)
+        self._written.move_to_end(session_id)
+        if len(self._written) > _WRITTEN_CACHE_SIZE:
+            self._written.popitem(last=False)
+
+    async def _write_session(self, session: Session) -> None:
+        """
+        Writes session metadata to the root document and appends the events not yet
+        persisted as a new segment. Sessions without a known write position are rewritten
+        from the first chunk.
+        """
+        event_count, chunk_count = self._written.get(session.id, (0, 0))
+        if event_count > len(session.events):
+            # A stale or partially loaded copy; writing it from the first chunk would drop persisted events
+            raise ValueError(f"Session {session.id} has {len(session.events)} events but {event_count} are already persisted")
+        data = session.model_dump(exclude_none=True, exclude={"events"})
+        new_events = session.events[event_count:]
+        # Events appended while the commit below is in flight are not part of this write
+        written = event_count + len(new_events)
+        pieces = []
+        if new_events or chunk_count == 0:
+            # Serialized straight to JSON bytes in one pydantic-core pass, without intermediate dicts
+            segment = _EVENTS_ADAPTER.dump_json([_without_large_blobs(e) for e in new_events], exclude_none=True)
+            pieces = _split_chunks(_CCTX.compress(segment))
+
+        doc_ref = self.db.collection(self.collection_name).document(session.id)
+        chunks_ref = doc_ref.collection(_CHUNKS_COLLECTION)
+        batch = self.db.batch()
+        for offset, piece in enumerate(pieces):
+            if offset and offset % _CHUNKS_PER_COMMIT == 0:
+                # Pieces are committed ahead of the root document, which only references
+                # them (via chunk_count) once every piece has been written
+                await batch.commit()
+                batch = self.db.batch()
+            idx = chunk_count + offset
+            batch.set(chunks_ref.document(str(idx)), {"idx": idx, "data": piece, "end": offset == len(pieces) - 1})
+        chunk_count += len(pieces)
+        data["chunk_count"] = chunk_count
+        # Drop any legacy inline events string now that events live in chunks
+        data["events"] = self.firestore_module.DELETE_FIELD
+        batch.set(doc_ref, data, merge=True)
+        await batch.commit()
+        self._remember_written(session.id, written, chunk_count)
+
+    async def _load_events(self, doc_ref, data: Dict[str, Any]) -> bytes:
+        """Reads the serialized events from the chunks subcollection, or the legacy inline JSON string."""
+        chunk_count = data.pop("chunk_count", None)
+        if chunk_count is None:
+            events_data = data.get("events")
+            if isinstance(events_data, str):
+                return events_data.encode("utf-8")
+            return orjson.dumps(events_data or [])
+        refs = [doc_ref.collection(_CHUNKS_COLLECTION).document(str(idx)) for idx in range(chunk_count)]
+        chunks = {}
+        async for snap in self.db.get_all(refs):
+            if snap.exists:
+                chunk = snap.to_dict()
+                chunks[chunk["idx"]] = chunk
+        segments, buf = [], []
+        for idx in range(chunk_count):
+            buf.append(chunks[idx]["data"])
+            if chunks[idx]["end"]:
+                segments.append(_DCTX.decompress(b"".join(buf)))
+                buf = []
+        return _join_segments(segments)
+
     async def update_session(self, *, user_id: str, session_id: str, app_name: str, state_update: Dict[str, Any]) -> None:
+        await self.flush(session_id)
         doc_ref = self.db.collection(self.collection_name).document(session_id)
         doc = await doc_ref.get()
         if doc.exists:
@@ -162,28 +327,55 @@ class FirestoreSessionService(BaseSessionService):
         if radar_id:
             query = query.where(filter=FieldFilter("state.radar_id", "==", radar_id))
         
-        docs = query.stream()
-        results = []
-        async for doc in docs:
-            data = doc.to_dict()
-            events_data = data.get("events")
-            if isinstance(events_data, str):
-                try:
-                    data["events"] = json.loads(events_data)
-                except:
-                    data["events"] = []
-            # Rescue legacy invalid base64 strings
-            data = rescue_blobs(data)
-            # Remove scrubbed file parts before inference
-            data = remove_scrubbed_parts(data)
-            results.append(Session.model_validate(data))
-        return results
+        docs = [doc async for doc in query.stream()]
+        datas = [doc.to_dict() for doc in docs]
+        # Each session's chunks are a separate read; fetch them all concurrently
+        raws = await asyncio.gather(
+            *(self._load_events(doc.reference, data) for doc, data in zip(docs, datas)),
+            return_exceptions=True
+        )
+        return [
+            _session_from_doc(data, b"[]" if isinstance(raw, Exception) else raw)
+            for data, raw in zip(datas, raws)
+        ]
 
     async def list_sessions_for_user(self, *, user_id: str, app_name: str, radar_id: Optional[str] = None) -> List[Session]:
         return await self.list_sessions(user_id=user_id, app_name=app_name, radar_id=radar_id)
 
+    async def list_session_summaries(self, *, user_id: str, app_name: str, radar_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Lists a user's sessions as {"id", "last_update_time", "state": {"title", "radar_id"}} dicts.
+        Only those fields are read server-side, so events and the rest of the state never leave Firestore.
+        """
+        from google.cloud.firestore import FieldFilter
+
+        query = self.db.collection(self.collection_name)\
+            .where(filter=FieldFilter("user_id", "==", user_id))\
+            .where(filter=FieldFilter("app_name", "==", app_name))
+
+        if radar_id:
+            query = query.where(filter=FieldFilter("state.radar_id", "==", radar_id))
+
+        query = query.select(["state.title", "state.radar_id", "last_update_time"])
+        summaries = []
+        async for doc in query.stream():
+            data = doc.to_dict()
+            summaries.append({"id": doc.id, "last_update_time": data.get("last_update_time"), "state": data.get("state") or {}})
+        return summaries
+
     async def delete_session(self, *, user_id: str, session_id: str, app_name: str) -> None:
-        await self.db.collection(self.collection_name).document(session_id).delete()
+        task = self._flush_tasks.pop(session_id, None)
+        if task:
+            task.cancel()
+        self._pending.pop(session_id, None)
+        self._write_locks.pop(session_id, None)
+        self._written.pop(session_id, None)
+        doc_ref = self.db.collection(self.collection_name).document(session_id)
+        batch = self.db.batch()
+        async for chunk_ref in doc_ref.collection(_CHUNKS_COLLECTION).list_documents():
+            batch.delete(chunk_ref)
+        batch.delete(doc_ref)
+        await batch.commit()
 
 def get_session_service():
     """Initializes and returns the appropriate session service."""
@@ -1,8 +1,8 @@
-import os
 import logging
 import datetime
 from typing import Any, Dict
 from google.cloud import firestore
+from app.core.firestore_client import get_firestore_client
 
 logger = logging.getLogger(__name__)
 
@@ -12,15 +12,7 @@ class UserDataService:
     """
     def __init__(self):
         try:
-            database_id = os.getenv("FIREBASE_DATABASE_ID", "(default)")
-            project_id = os.getenv("VITE_FIREBASE_PROJECT_ID")
-            
-            key_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "gcp-sa-key.json")
-            if os.path.exists(key_path):
-                self.db = firestore.AsyncClient.from_service_account_json(key_path, database=database_id)
-                logger.info(f"Initialized Firestore Client using {key_path}")
-            else:
-                self.db = firestore.AsyncClient(database=database_id, project=project_id)
+            self.db = get_firestore_client()
         except Exception as e:
             logger.error(f"Failed to initialize Firestore Client: {e}")
             self.db = None
@@ -1,4 +1,5 @@
 
+import asyncio
 import logging
 import os
 import datetime
@@ -23,17 +24,7 @@ class UserProfilingService:
             # We try to fetch from main apps.
             # In a real scenario, we might query all sessions or have a unified index.
             apps = ["Aletheia", "aletheia_radar", "aletheia_exploration", "aletheia_projects"]
-            all_sessions = []
-            
-            for app_name in apps:
-                sessions = await session_service.list_sessions_for_user(user_id=user_id, app_name=app_name)
-                all_sessions.extend(sessions)
-            
-            # Sort by last_update_time desc
-            all_sessions.sort(key=lambda x: x.last_update_time or 0, reverse=True)
-            
-            # Take recent sessions
-            recent_sessions = all_sessions[:5]
+            recent_sessions = await self._fetch_recent_sessions(user_id, apps, 5)
             
             messages = []
             for sess in recent_sessions:
@@ -67,6 +58,27 @@ class UserProfilingService:
             
         return history_text
 
+    async def _fetch_recent_sessions(self, user_id: str, apps: list, count: int) -> list:
+        """Returns the user's `count` most recently updated sessions across apps, events included."""
+        list_summaries = getattr(session_service, "list_session_summaries", None)
+        if not callable(list_summaries):
+            all_sessions = []
+            for app_name in apps:
+                sessions = await session_service.list_sessions_for_user(user_id=user_id, app_name=app_name)
+                all_sessions.extend(sessions)
+            all_sessions.sort(key=lambda x: x.last_update_time or 0, reverse=True)
+            return all_sessions[:count]
+
+        # Pick the recent sessions from projected summaries, then load only those with their events
+        listed = await asyncio.gather(*(list_summaries(user_id=user_id, app_name=app_name) for app_name in apps))
+        summaries = [(s.get("last_update_time") or 0, s["id"], app_name) for app_name, app_summaries in zip(apps, listed) for s in app_summaries]
+        summaries.sort(reverse=True)
+        sessions = await asyncio.gather(*(
+            session_service.get_session(user_id=user_id, session_id=session_id, app_name=app_name)
+            for _, session_id, app_name in summaries[:count]
+        ), return_exceptions=True)
+        return [s for s in sessions if s and not isinstance(s, Exception)]
+
     async def log_activity(self, user_id: str, activity_type: str, details: dict):
         """
         Logs a user activity.
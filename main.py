@@ -1,12 +1,15 @@
 import os
 import logging
-import sys
 import asyncio
 
 from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
+from fastapi.responses import FileResponse, ORJSONResponse
+from fastapi.routing import APIRoute
+from starlette.routing import Match
 from dotenv import load_dotenv
 from app.core.config import STATIC_DIR, DOCS_DIR, BUCKET_NAME
 from app.api import research, threads, session, radars, exploration, projects, user, activities
@@ -18,10 +21,7 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Ensure the current directory is in sys.path to allow imports from 'app'
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 @app.on_event("startup")
 async def startup_event():
@@ -32,15 +32,28 @@ async def startup_event():
     from app.services.scheduler import start_scheduler
     start_scheduler()
 
-# CORS Middleware setup
+# Compress JSON and HTML responses; the NDJSON research stream is left as is so each
+# update reaches the client as soon as it is written
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    GZipMiddleware,
+    minimum_size=1024,
+    compresslevel=5,
+    exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/x-ndjson",),
 )
 
+# CORS Middleware setup
+# The SPA is served from this app (and proxied by Vite in development), so requests are
+# same-origin; CORS is only needed when FRONTEND_ORIGIN lists separately hosted frontends.
+_FRONTEND_ORIGINS = [o.strip() for o in os.getenv("FRONTEND_ORIGIN", "").split(",") if o.strip()]
+if _FRONTEND_ORIGINS:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=_FRONTEND_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
 # Mount Routers
 app.include_router(research.router, prefix="/api/research", tags=["Research"])
 app.include_router(radars.router, prefix="/api/radars", tags=["Radars"])
@@ -69,18 +82,17 @@ async def serve_static_content(folder: str, filename: str):
     }
     
     target_dir = folder_map.get(folder)
-    # Ensure dir exists locally
-    os.makedirs(target_dir, exist_ok=True)
-    
     local_path = os.path.join(target_dir, filename)
     
     # Sanity check for path traversal
     if not os.path.abspath(local_path).startswith(os.path.abspath(target_dir)):
         raise HTTPException(status_code=403, detail="Invalid path")
     
-    # 1. Check Local
-    if os.path.exists(local_path):
-        return FileResponse(local_path)
+    # 1. Check Local (one stat serves as both the existence check and the response headers)
+    try:
+        return FileResponse(local_path, stat_result=os.stat(local_path))
+    except FileNotFoundError:
+        pass
 
     # 2. Try Restore from GCS
     try:
@@ -97,6 +109,8 @@ async def serve_static_content(folder: str, filename: str):
             
             if blob.exists():
                 logger.info(f"Restoring {blob_name} from GCS to {local_path}")
+                # Ensure dir exists locally
+                os.makedirs(target_dir, exist_ok=True)
                 blob.download_to_filename(local_path)
                 return FileResponse(local_path)
             else:
@@ -111,31 +125,66 @@ async def serve_static_content(folder: str, filename: str):
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 # Serve Frontend (Production / Dist)
+# Paths owned by the API and the static mounts never fall through to the SPA
+_RESERVED_PREFIXES = ("/api/", "/static/", "/assets/")
+
+class SPAFallbackRoute(APIRoute):
+    """Catch-all route that declines reserved paths before the handler is dispatched."""
+    def matches(self, scope):
+        if scope["type"] == "http" and scope["path"].startswith(_RESERVED_PREFIXES):
+            return Match.NONE, {}
+        return super().matches(scope)
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles for content-hashed build output, which clients may cache indefinitely."""
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+def _build_dist_manifest(root: str) -> dict:
+    """Maps each built frontend file (relative URL path) to its on-disk path and stat."""
+    manifest = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            abs_path = os.path.join(dirpath, name)
+            rel_path = os.path.relpath(abs_path, root).replace(os.sep, "/")
+            manifest[rel_path] = (abs_path, os.stat(abs_path))
+    return manifest
+
 if os.path.exists("dist"):
     logger.info("Serving production frontend from 'dist' directory.")
-    app.mount("/assets", StaticFiles(directory="dist/assets"), name="assets")
+    app.mount("/assets", ImmutableStaticFiles(directory="dist/assets"), name="assets")
+    # dist is immutable after build, so resolve files once instead of stat-ing per request
+    _DIST_FILES = _build_dist_manifest("dist")
     
-    @app.get("/{full_path:path}")
     async def serve_frontend(full_path: str):
-        # Explicitly check if the file exists in the 'dist' directory
-        dist_file_path = os.path.join("dist", full_path)
-        if full_path and os.path.isfile(dist_file_path):
-            return FileResponse(dist_file_path)
-            
-        # API/Static fall-through check
-        if full_path.startswith("api/") or full_path.startswith("static/"):
-            logger.warning(f"Static/API request fall-through to catch-all: {full_path}")
-            raise HTTPException(status_code=404, detail=f"The requested asset '{full_path}' was not found.")
+        # Serve the file directly if it exists in the 'dist' build
+        entry = _DIST_FILES.get(full_path)
+        if entry:
+            return FileResponse(entry[0], stat_result=entry[1])
         
         # SPA fallback
-        index_path = "dist/index.html"
-        if os.path.exists(index_path):
-            return FileResponse(index_path)
+        index_entry = _DIST_FILES.get("index.html")
+        if index_entry:
+            return FileResponse(index_entry[0], stat_result=index_entry[1])
             
         return HTTPException(status_code=404, detail="Application entry point (index.html) not found.")
+
+    app.router.routes.append(SPAFallbackRoute("/{full_path:path}", serve_frontend, methods=["GET"]))
 else:
     logger.warning("'dist' directory not found. Frontend will not be served.")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Each worker starts its own radar scheduler, so scale out via WEB_CONCURRENCY explicitly
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 8000)),
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", 1)),
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+    )